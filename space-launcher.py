@@ -6,6 +6,7 @@ Versión corregida con inicialización de mundo y dependencias
 """
 
 import os
+import errno
 import sys
 import subprocess
 import time
@@ -14,11 +15,14 @@ import zipfile
 import signal
 import threading
 import shutil
-import platform
-import json
+import functools
+import mmap
+import re
+import selectors
+import socket
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from urllib.request import urlopen, Request
-from urllib.error import URLError, HTTPError
 
 # Configurar logging
 logging.basicConfig(
@@ -36,26 +40,148 @@ CONFIG = {
     "cloudflared_url": "https://github.com/cloudflare/cloudflared/releases/latest/download/cloudflared-linux-amd64",
     "timeout": 60,
     "max_retries": 3,
+    "download_parts": 6,  # Conexiones paralelas para descargas por rangos
+    "chunk_size": 1024 * 1024,  # Tamaño del buffer de lectura/escritura (1 MiB)
+    "extract_batch_bytes": 64 * 1024,  # Miembros menores se extraen en lotes
+    "parallel_extract_min_bytes": 10 * 1024 * 1024,  # ZIPs menores se extraen en serie
     "user_agent": "SpaceBedrockLauncher/2.1 (Manual-ZIP-Version)",
-    "world_name": "Space-World"  # Nuevo: Nombre del mundo predeterminado
+    "world_name": "Space-World",  # Nuevo: Nombre del mundo predeterminado
+    "tunnel_ready_timeout": 30,  # Segundos máximos esperando al túnel
+    "backup_compresslevel": None  # None = sin compresión; 1-9 = ZIP_DEFLATED
 }
 
+# Sin compresión de transporte: los binarios no se comprimen y Content-Length
+# debe coincidir con los bytes escritos en disco
+DOWNLOAD_HEADERS = {'User-Agent': CONFIG["user_agent"], 'Accept-Encoding': 'identity'}
+
+# Mensajes de cloudflared que indican una conexión registrada
+TUNNEL_READY_PATTERN = re.compile(rb"Registered tunnel connection|Connection [0-9a-f-]+ registered")
+
+# Valores por defecto de server.properties (orden de escritura)
+SERVER_PROPERTIES = (
+    ("server-name", "Space Bedrock Server"),
+    ("gamemode", "survival"),
+    ("difficulty", "normal"),
+    ("allow-cheats", "false"),
+    ("max-players", "10"),
+    ("online-mode", "true"),
+    ("server-port", str(CONFIG["port"])),
+    ("level-name", CONFIG["world_name"]),  # Usar el nombre configurado
+    ("level-seed", ""),  # Semilla aleatoria
+    ("default-player-permission-level", "member"),
+    ("player-idle-timeout", "30"),
+    ("view-distance", "12"),
+    ("max-threads", "0"),
+    ("server-authoritative-movement", "server-auth"),
+    ("compression-threshold", "1"),
+    ("content-log-file-enabled", "true"),  # Nuevo: Habilitar logs
+    ("debug-output", "true")  # Nuevo: Más información en logs
+)
+
+# Palabras clave para reconocer un ZIP del servidor con otro nombre
+ZIP_KEYWORDS_PATTERN = re.compile(r"bedrock|server|minecraft", re.IGNORECASE)
+
+# Plantilla del menú interactivo (se formatea una sola vez por instancia)
+MENU_TEMPLATE = """
+        ███████╗██████╗  █████╗  ██████╗███████╗
+        ██╔════╝██╔══██╗██╔══██╗██╔════╝██╔════╝
+        ███████╗██████╔╝███████║██║     █████╗  
+        ╚════██║██╔═══╝ ██╔══██║██║     ██╔══╝  
+        ███████║██║     ██║  ██║╚██████╗███████╗
+        ╚══════╝╚═╝     ╚═╝  ╚═╝ ╚═════╝╚══════╝
+        
+        Space Bedrock Server Launcher v2.1 (Manual ZIP)
+        {separator}
+        Versión: Manual ZIP
+        Entorno: {environment}
+        Directorio: {data_dir}
+        Puerto: {port}
+        Mundo: {world_name}
+        {separator}
+        1. Iniciar servidor
+        2. Ver archivos ZIP disponibles
+        3. Configurar túnel
+        4. Editar configuración
+        5. Crear backup del mundo
+        6. Reinstalar servidor (eliminar instalación actual)
+        7. Salir
+        {separator}
+        """
+
+# Señales atendidas por el hilo de cierre
+SHUTDOWN_SIGNALS = {signal.SIGINT, signal.SIGTERM}
+
+def restore_child_signals():
+    """Desbloquea las señales de cierre en los procesos hijos"""
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, SHUTDOWN_SIGNALS)
+
+def clear_screen():
+    """Limpia la terminal sin lanzar procesos externos"""
+    if os.name == 'nt':
+        # Las consolas antiguas de Windows no interpretan secuencias ANSI
+        os.system('cls')
+    else:
+        sys.stdout.write("\x1b[H\x1b[2J")
+        sys.stdout.flush()
+
+class MappedFile(mmap.mmap):
+    """mmap de solo lectura que zipfile puede usar como archivo"""
+    def seekable(self):
+        return True
+
 class SpaceBedrockManager:
     def __init__(self):
         self.server_process = None
         self.tunnel_process = None
         self.running = False
-        self.is_codespaces = self.detect_codespaces()
         self.connection_info = {}
+        self.dependencies_ok = False  # Evita repetir dpkg/apt en cada inicio
+        self.shutdown_event = threading.Event()
+        self.cleanup_lock = threading.Lock()
+        self.child_preexec = None  # Restaura la máscara de señales en procesos hijos
+        self.cloudflare_token = None
+        self.cloudflared_download = None  # Future de la descarga en segundo plano
+        
+        # Rutas derivadas de data_dir, construidas una sola vez
+        # Ruta absoluta: no depende del directorio de trabajo en cada llamada
+        self.data_path = Path(CONFIG["data_dir"]).resolve()
+        self.server_path = self.data_path / "bedrock_server"
+        self.config_path = self.data_path / "server.properties"
+        self.worlds_path = self.data_path / "worlds"
+        self.cloudflared_path = self.data_path / "cloudflared"
+        
+    @functools.cached_property
+    def is_codespaces(self):
+        """Resultado de detect_codespaces, calculado una sola vez"""
+        return self.detect_codespaces()
         
     def detect_codespaces(self):
         """Detecta si estamos ejecutando en GitHub Codespaces"""
         return os.getenv('CODESPACES') == 'true' or os.getenv('GITHUB_CODESPACES_PORT_FORWARDING_DOMAIN') is not None
         
     def setup_signal_handlers(self):
-        """Configura manejadores de señales para cierre limpio"""
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
+        """Configura el cierre limpio con un hilo dedicado a sigwait"""
+        if not hasattr(signal, "pthread_sigmask"):
+            signal.signal(signal.SIGINT, self.signal_handler)
+            signal.signal(signal.SIGTERM, self.signal_handler)
+            return
+        
+        # Bloquear antes de crear hilos para que solo el hilo dedicado las reciba
+        signal.pthread_sigmask(signal.SIG_BLOCK, SHUTDOWN_SIGNALS)
+        self.child_preexec = restore_child_signals
+        threading.Thread(target=self.signal_wait, daemon=True).start()
+    
+    def signal_wait(self):
+        """Espera señales de cierre de forma síncrona"""
+        signal.sigwait(SHUTDOWN_SIGNALS)
+        logging.info("Recibida señal de cierre, deteniendo servicios...")
+        self.shutdown_event.set()
+        server_running = self.running
+        self.cleanup()
+        
+        # Con el servidor activo, el hilo principal crea el backup y sale
+        if not server_running:
+            os._exit(0)
     
     def signal_handler(self, signum, frame):
         """Maneja señales de cierre"""
@@ -67,7 +193,7 @@ class SpaceBedrockManager:
         """Configuración inicial del entorno para Space"""
         logging.info("🛸 Preparando entorno Space...")
         
-        data_path = Path(CONFIG["data_dir"])
+        data_path = self.data_path
         data_path.mkdir(exist_ok=True)
         
         # Configuraciones específicas para Codespaces
@@ -83,14 +209,22 @@ class SpaceBedrockManager:
             
             if free_gb < 1.0:
                 logging.warning("⚠️ Poco espacio en disco disponible")
-        except:
+        except OSError:
             pass
         
         return True
 
+    def scan_zip_files(self, directory):
+        """Lista los .zip de un directorio en una sola pasada de os.scandir"""
+        try:
+            with os.scandir(directory) as entries:
+                return [e for e in entries if e.name.lower().endswith('.zip') and e.is_file()]
+        except FileNotFoundError:
+            return []
+
     def find_manual_zip(self):
         """Busca archivos ZIP del servidor Bedrock subidos manualmente"""
-        data_path = Path(CONFIG["data_dir"])
+        data_path = self.data_path
         current_path = Path(".")
         
         # Buscar en varios nombres y ubicaciones posibles
@@ -105,58 +239,147 @@ class SpaceBedrockManager:
         # Buscar en directorio actual y data_dir
         search_paths = [current_path, data_path]
         
+        # Un único scandir por directorio sirve para ambas búsquedas; un nombre
+        # exacto en el directorio actual evita listar data_dir
+        scans = []
         for search_path in search_paths:
+            entries = self.scan_zip_files(search_path)
+            scans.append((search_path, entries))
+            found = {entry.name for entry in entries}
             for zip_name in possible_names:
-                zip_path = search_path / zip_name
-                if zip_path.exists():
+                if zip_name in found:
+                    zip_path = search_path / zip_name
                     logging.info(f"📦 Encontrado ZIP manual: {zip_path}")
                     return zip_path
         
         # Buscar cualquier archivo .zip que contenga "bedrock" o "server"
-        for search_path in search_paths:
-            for zip_file in search_path.glob("*.zip"):
-                zip_name_lower = zip_file.name.lower()
-                if any(keyword in zip_name_lower for keyword in ["bedrock", "server", "minecraft"]):
+        for search_path, entries in scans:
+            for entry in entries:
+                if ZIP_KEYWORDS_PATTERN.search(entry.name):
+                    zip_file = Path(entry.path)
                     logging.info(f"📦 Encontrado ZIP candidato: {zip_file}")
                     return zip_file
         
         return None
 
     def validate_bedrock_zip(self, zip_path):
-        """Valida que el ZIP contiene un servidor Bedrock válido"""
+        """Valida el ZIP del servidor Bedrock; devuelve sus miembros o None"""
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                file_list = zip_ref.namelist()
+            with open(zip_path, 'rb') as f, zipfile.ZipFile(f, 'r') as zip_ref:
+                # Pedir al kernel que precargue el archivo antes de extraer
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
                 
-                # Verificar archivos esenciales del servidor Bedrock
-                required_files = ['bedrock_server']
-                optional_files = ['server.properties', 'allowlist.json', 'permissions.json']
+                # Índice nombre → ZipInfo ya construido al leer el directorio central
+                names = zip_ref.NameToInfo
                 
-                has_server = any('bedrock_server' in f for f in file_list)
+                # Verificar archivos esenciales del servidor Bedrock
+                has_server = 'bedrock_server' in names or any('bedrock_server' in f for f in names)
                 if not has_server:
                     logging.error("❌ El ZIP no contiene el ejecutable 'bedrock_server'")
-                    return False
+                    return None
                 
-                logging.info(f"✅ ZIP válido con {len(file_list)} archivos")
+                logging.info(f"✅ ZIP válido con {len(names)} archivos")
                 
                 # Mostrar contenido relevante
-                bedrock_files = [f for f in file_list if not f.endswith('/')][:10]
-                logging.info(f"📋 Archivos encontrados: {', '.join(bedrock_files[:5])}")
-                if len(bedrock_files) > 5:
-                    logging.info(f"    ... y {len(bedrock_files)-5} archivos más")
+                bedrock_files = list(itertools.islice((f for f in names if not f.endswith('/')), 5))
+                logging.info(f"📋 Archivos encontrados: {', '.join(bedrock_files)}")
+                if len(names) > 5:
+                    logging.info(f"    ... y {len(names)-5} archivos más")
                 
-                return True
+                # La extracción reutiliza este directorio central ya leído
+                return zip_ref.infolist()
                 
         except zipfile.BadZipFile:
             logging.error("❌ El archivo no es un ZIP válido")
-            return False
+            return None
         except Exception as e:
             logging.error(f"❌ Error validando ZIP: {e}")
-            return False
+            return None
+
+    def extract_zip(self, zip_path, target_dir, infos=None):
+        """Extrae el ZIP en paralelo, miembro a miembro con copia por bloques"""
+        target_root = target_dir.resolve()
+        jobs = []
+        batch = []
+        batch_size = 0
+        
+        if infos is None:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                infos = zip_ref.infolist()
+        
+        # Crear directorios y agrupar miembros pequeños en lotes
+        for info in infos:
+            target = (target_root / info.filename).resolve()
+            if target != target_root and target_root not in target.parents:
+                logging.warning(f"⚠️ Ruta insegura omitida: {info.filename}")
+                continue
+            
+            if info.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+            
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if info.file_size >= CONFIG["extract_batch_bytes"]:
+                jobs.append([(info, target)])
+                continue
+            
+            batch.append((info, target))
+            batch_size += info.file_size
+            if batch_size >= CONFIG["extract_batch_bytes"]:
+                jobs.append(batch)
+                batch = []
+                batch_size = 0
+        
+        if batch:
+            jobs.append(batch)
+        
+        # ZipFile no es seguro entre hilos: cada hilo abre su propio handle
+        local = threading.local()
+        handles = []
+        handles_lock = threading.Lock()
+        
+        # Sin fsync por archivo: la escritura diferida del sistema agrupa los datos
+        def extract_job(job):
+            if not hasattr(local, "zip_ref"):
+                local.zip_file = open(zip_path, 'rb')
+                # Leer desde un mmap propio: los seeks por miembro no hacen syscalls
+                local.zip_map = MappedFile(local.zip_file.fileno(), 0, access=mmap.ACCESS_READ)
+                local.zip_ref = zipfile.ZipFile(local.zip_map, 'r')
+                local.buf = bytearray(CONFIG["chunk_size"])
+                with handles_lock:
+                    handles.extend((local.zip_ref, local.zip_map, local.zip_file))
+            
+            for info, target in job:
+                if info.file_size == 0:
+                    # Archivo vacío: no hace falta abrir el miembro
+                    open(target, 'wb').close()
+                else:
+                    # Siempre a través de ZipFile: comprueba el CRC32 también en miembros sin comprimir
+                    with local.zip_ref.open(info) as src, open(target, 'wb') as dst:
+                        self.stream_copy(src, dst, local.buf)
+                
+                # Conservar permisos Unix (bits de ejecución) guardados en el ZIP
+                mode = (info.external_attr >> 16) & 0o777
+                if mode:
+                    os.chmod(target, mode)
+        
+        # zlib libera el GIL al descomprimir, así que bastan hilos; los ZIP pequeños van en serie
+        total_size = sum(info.file_size for info in infos)
+        if total_size < CONFIG["parallel_extract_min_bytes"]:
+            workers = 1
+        else:
+            workers = min(8, os.cpu_count() or 2)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(extract_job, jobs))
+        finally:
+            for handle in handles:
+                handle.close()
 
     def install_bedrock_server(self):
         """Instala el servidor Bedrock desde ZIP manual"""
-        server_path = Path(CONFIG["data_dir"]) / "bedrock_server"
+        server_path = self.server_path
         
         if server_path.exists():
             logging.info("✅ Servidor ya instalado")
@@ -173,14 +396,22 @@ class SpaceBedrockManager:
             return False
         
         # Validar el ZIP
-        if not self.validate_bedrock_zip(zip_path):
+        infos = self.validate_bedrock_zip(zip_path)
+        if not infos:
             return False
         
         # Extraer el servidor
         try:
+            # Comprobar el espacio antes de extraer: sin él fallaría a mitad de camino
+            needed = sum(info.file_size for info in infos)
+            free = shutil.disk_usage(self.data_path).free
+            if free < needed:
+                logging.error(f"❌ Espacio insuficiente: se necesitan {needed / (1024*1024):.0f}MB "
+                              f"y hay {free / (1024*1024):.0f}MB libres")
+                return False
+            
             logging.info(f"📦 Extrayendo servidor desde: {zip_path.name}")
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(CONFIG["data_dir"])
+            self.extract_zip(zip_path, self.data_path, infos)
             
             # Verificar extracción
             if not server_path.exists():
@@ -193,8 +424,15 @@ class SpaceBedrockManager:
             logging.info("🎉 Servidor instalado correctamente desde ZIP manual")
             return True
             
+        except zipfile.BadZipFile as e:
+            # La extracción comprueba el CRC32 de cada miembro al leerlo
+            logging.error(f"❌ ZIP corrupto: {e}")
+            # Sin ejecutable el próximo inicio no dará por buena una extracción parcial
+            server_path.unlink(missing_ok=True)
+            return False
         except Exception as e:
             logging.error(f"❌ Error al extraer: {e}")
+            server_path.unlink(missing_ok=True)
             return False
 
     def setup_tunnel(self):
@@ -219,71 +457,225 @@ class SpaceBedrockManager:
         
         return True
 
+    def stream_copy(self, src, dst, buf=None):
+        """Copia un flujo a otro reutilizando un único buffer"""
+        if buf is None:
+            buf = bytearray(CONFIG["chunk_size"])
+        view = memoryview(buf)
+        total = 0
+        while True:
+            n = src.readinto(view)
+            if not n:
+                break
+            dst.write(view[:n])
+            total += n
+        return total
+
+    def probe_range_support(self, url):
+        """Comprueba si el servidor acepta descargas por rangos"""
+        from urllib.request import urlopen, Request
+        
+        headers = {**DOWNLOAD_HEADERS, 'Range': 'bytes=0-0'}
+        req = Request(url, headers=headers)
+        
+        with urlopen(req, timeout=CONFIG["timeout"]) as response:
+            if response.status != 206:
+                return None
+            total = response.headers.get('Content-Range', '').rpartition('/')[2]
+            if not total.isdigit():
+                return None
+            # Usar la URL final para no repetir redirecciones en cada parte
+            return response.geturl(), int(total)
+
+    def download_file_ranged(self, url, destination, parts=None):
+        """Descarga un archivo en varias partes paralelas usando HTTP Range"""
+        from urllib.request import urlopen, Request
+        from urllib.error import URLError
+        from http.client import HTTPException
+        
+        if not hasattr(os, "pwrite"):
+            return False
+        
+        # Si la sonda falla (timeout, 403/405/416...) se usa la descarga en un solo flujo
+        try:
+            probe = self.probe_range_support(url)
+        except (URLError, HTTPException, OSError) as e:
+            logging.warning(f"⚠️ Descarga por rangos no disponible ({e}), usando un solo flujo")
+            return False
+        if not probe:
+            return False
+        
+        final_url, length = probe
+        parts = parts or CONFIG["download_parts"]
+        part_size = max(1, -(-length // parts))
+        ranges = [(start, min(length, start + part_size) - 1)
+                  for start in range(0, length, part_size)]
+        
+        fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        
+        def fetch_range(byte_range):
+            start, end = byte_range
+            view = memoryview(bytearray(CONFIG["chunk_size"]))
+            offset = start
+            
+            # Cada reintento continúa desde el último byte recibido
+            for attempt in range(CONFIG["max_retries"]):
+                headers = {**DOWNLOAD_HEADERS, 'Range': f'bytes={offset}-{end}'}
+                req = Request(final_url, headers=headers)
+                try:
+                    with urlopen(req, timeout=CONFIG["timeout"]) as response:
+                        if response.status != 206:
+                            raise IOError(f"El servidor ignoró el rango {offset}-{end}")
+                        while True:
+                            n = response.readinto(view)
+                            if not n:
+                                break
+                            written = 0
+                            while written < n:
+                                written += os.pwrite(fd, view[written:n], offset + written)
+                            offset += n
+                except (URLError, HTTPException, OSError) as e:
+                    logging.warning(f"⚠️ Reintentando parte {start}-{end}: {e}")
+                
+                if offset == end + 1:
+                    return
+                if attempt < CONFIG["max_retries"] - 1:
+                    time.sleep(0.5 * (attempt + 1))
+            
+            raise IOError(f"Parte incompleta {start}-{end}")
+        
+        try:
+            # Reservar bloques contiguos; ftruncate solo crea un archivo disperso
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, length)
+            else:
+                os.ftruncate(fd, length)
+            with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                list(executor.map(fetch_range, ranges))
+        finally:
+            os.close(fd)
+        
+        return True
+
+    def download_file_stream(self, url, destination):
+        """Descarga en un solo flujo, reanudando con Range tras un corte"""
+        from urllib.request import urlopen, Request
+        from urllib.error import URLError, HTTPError
+        from http.client import HTTPException
+        
+        for attempt in range(CONFIG["max_retries"]):
+            downloaded = destination.stat().st_size if attempt and destination.exists() else 0
+            headers = dict(DOWNLOAD_HEADERS)
+            if downloaded:
+                headers['Range'] = f'bytes={downloaded}-'
+            
+            try:
+                with urlopen(Request(url, headers=headers), timeout=CONFIG["timeout"]) as response:
+                    # Si el servidor ignora el rango reenvía el archivo completo
+                    mode = 'ab' if response.status == 206 else 'wb'
+                    expected = response.headers.get('Content-Length')
+                    with open(destination, mode) as f:
+                        # Reservar el tamaño completo solo al empezar de cero (en 'ab' se escribe al final)
+                        if mode == 'wb' and expected and hasattr(os, "posix_fallocate"):
+                            try:
+                                os.posix_fallocate(f.fileno(), 0, int(expected))
+                            except OSError as e:
+                                # Sin espacio no tiene sentido descargar; otros errores solo impiden reservar
+                                if e.errno == errno.ENOSPC:
+                                    raise
+                        try:
+                            copied = self.stream_copy(response, f)
+                        finally:
+                            # Recortar lo reservado sin escribir: la reanudación parte del tamaño real
+                            f.truncate(f.tell())
+                
+                if expected is None or copied == int(expected):
+                    return
+                logging.warning(f"⚠️ Descarga cortada ({copied}/{expected} bytes), reintentando...")
+            except HTTPError as e:
+                if e.code == 416:
+                    # Rango no válido: empezar de cero en el siguiente intento
+                    destination.unlink(missing_ok=True)
+                elif 400 <= e.code < 500 and e.code not in (408, 429):
+                    # Error del cliente (404, 403...): reintentar no lo arregla
+                    raise
+                logging.warning(f"⚠️ Error HTTP {e.code}, reintentando...")
+            except (URLError, HTTPException, OSError) as e:
+                if getattr(e, "errno", None) == errno.ENOSPC:
+                    # Disco lleno: reintentar no liberará espacio
+                    raise
+                logging.warning(f"⚠️ Error de red ({e}), reintentando...")
+            
+            if attempt < CONFIG["max_retries"] - 1:
+                time.sleep(2 ** attempt)
+        
+        raise IOError(f"Descarga incompleta tras {CONFIG['max_retries']} intentos")
+
     def download_cloudflared(self, destination):
         """Descarga Cloudflared si es necesario"""
         logging.info("⬇️ Descargando Cloudflared...")
         
+        # Descargar a un .part y renombrar al terminar: un fallo no deja un binario
+        # incompleto que exists() daría por instalado
+        part_path = destination.with_name(destination.name + ".part")
         try:
-            headers = {'User-Agent': CONFIG["user_agent"]}
-            req = Request(CONFIG["cloudflared_url"], headers=headers)
-            
-            with urlopen(req, timeout=CONFIG["timeout"]) as response:
-                with open(destination, 'wb') as f:
-                    shutil.copyfileobj(response, f)
+            if not self.download_file_ranged(CONFIG["cloudflared_url"], part_path):
+                self.download_file_stream(CONFIG["cloudflared_url"], part_path)
             
-            destination.chmod(0o755)
+            part_path.chmod(0o755)
+            os.replace(part_path, destination)
             logging.info("✅ Cloudflared descargado correctamente")
             return True
             
         except Exception as e:
             logging.error(f"❌ Error descargando Cloudflared: {e}")
+            part_path.unlink(missing_ok=True)
             return False
 
     def install_cloudflared_apt(self):
         """Instala Cloudflared usando el repositorio oficial de Cloudflare (Debian/Ubuntu)"""
+        from urllib.request import urlopen, Request
+        from urllib.error import URLError
+        from http.client import HTTPException
+        
         try:
-            logging.info("🔑 Añadiendo clave GPG de Cloudflare...")
-            gpg_cmd = [
-                "sudo", "mkdir", "-p", "--mode=0755", "/usr/share/keyrings"
-            ]
-            subprocess.run(gpg_cmd, check=True)
-            
-            curl_gpg = subprocess.Popen(
-                ["curl", "-fsSL", "https://pkg.cloudflare.com/cloudflare-main.gpg"],
-                stdout=subprocess.PIPE
-            )
-            tee_gpg = subprocess.Popen(
-                ["sudo", "tee", "/usr/share/keyrings/cloudflare-main.gpg"],
-                stdin=curl_gpg.stdout,
-                stdout=subprocess.DEVNULL
-            )
-            curl_gpg.stdout.close()
-            tee_gpg.communicate()
+            logging.info("🔑 Descargando clave GPG de Cloudflare...")
+            req = Request("https://pkg.cloudflare.com/cloudflare-main.gpg", headers=DOWNLOAD_HEADERS)
+            with urlopen(req, timeout=CONFIG["timeout"]) as response:
+                gpg_key = response.read()
             
-            logging.info("📦 Añadiendo repositorio de Cloudflared...")
+            logging.info("📦 Añadiendo clave y repositorio de Cloudflared...")
+            # Un único sudo: la clave llega por stdin, sin curl ni tee aparte
             repo_cmd = [
                 "sudo", "sh", "-c",
+                "mkdir -p --mode=0755 /usr/share/keyrings && "
+                "cat > /usr/share/keyrings/cloudflare-main.gpg && "
                 "echo 'deb [signed-by=/usr/share/keyrings/cloudflare-main.gpg] "
                 "https://pkg.cloudflare.com/cloudflared any main' > "
                 "/etc/apt/sources.list.d/cloudflared.list"
             ]
-            subprocess.run(repo_cmd, check=True)
-            
-            logging.info("🔄 Actualizando paquetes...")
-            subprocess.run(["sudo", "apt-get", "update"], check=True)
+            subprocess.run(repo_cmd, input=gpg_key, check=True, preexec_fn=self.child_preexec)
             
-            logging.info("⬇️ Instalando cloudflared...")
-            subprocess.run(["sudo", "apt-get", "install", "-y", "cloudflared"], check=True)
+            logging.info("🔄 Actualizando paquetes e instalando cloudflared...")
+            apt_cmd = [
+                "sudo", "sh", "-c",
+                "apt-get update -qq && DEBIAN_FRONTEND=noninteractive "
+                "apt-get install -y --no-install-recommends cloudflared"
+            ]
+            subprocess.run(apt_cmd, check=True, preexec_fn=self.child_preexec)
             
             logging.info("✅ Cloudflared instalado correctamente via APT")
             return True
             
-        except subprocess.CalledProcessError as e:
+        except (subprocess.CalledProcessError, URLError, HTTPException, OSError) as e:
             logging.error(f"❌ Error durante instalación APT: {e}")
             return False
 
     def get_cloudflare_token(self):
         """Obtiene el token de múltiples fuentes seguras"""
+        if self.cloudflare_token:
+            return self.cloudflare_token
+        
         # 1. Intenta desde variables de entorno (GitHub Secrets)
         token = os.getenv("CLOUDFLARED_TOKEN")
         
@@ -292,6 +684,7 @@ class SpaceBedrockManager:
             token_path = Path("/workspaces/.codespaces/shared/environment-variables.json")
             if token_path.exists():
                 try:
+                    import json
                     with open(token_path, 'r') as f:
                         env_vars = json.load(f)
                         token = env_vars.get("CLOUDFLARED_TOKEN", "")
@@ -302,7 +695,7 @@ class SpaceBedrockManager:
         
         # 3. Último recurso: archivo local (NO RECOMENDADO)
         if not token:
-            local_token = Path(CONFIG["data_dir"]) / "cloudflare-token.txt"
+            local_token = self.data_path / "cloudflare-token.txt"
             if local_token.exists():
                 try:
                     with open(local_token, 'r') as f:
@@ -311,20 +704,63 @@ class SpaceBedrockManager:
                 except Exception as e:
                     logging.error(f"❌ Error leyendo token local: {e}")
         
+        self.cloudflare_token = token
         return token
 
+    def report_missing_token(self):
+        """Muestra instrucciones cuando no hay token de Cloudflare"""
+        logging.error("""
+        ❌ ERROR: Token de Cloudflare no configurado
+        === INSTRUCCIONES PARA GITHUB CODESPACES ===
+        1. Ve a: https://github.com/<tu-usuario>/<tu-repo>/settings/secrets/codespaces
+        2. Crea un secret llamado CLOUDFLARED_TOKEN
+        3. Pega tu token de Cloudflare Zero Trust
+        4. Reinicia este Codespace
+        """)
+
+    def wait_tunnel_ready(self, process):
+        """Espera a que cloudflared registre una conexión del túnel"""
+        if os.name == "nt":
+            # select() no admite pipes en Windows
+            time.sleep(5)
+            return process.poll() is None
+        
+        deadline = time.monotonic() + CONFIG["tunnel_ready_timeout"]
+        fd = process.stderr.fileno()
+        pending = b""
+        
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+            while process.poll() is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                if not selector.select(timeout=remaining):
+                    continue
+                
+                data = os.read(fd, 65536)
+                if not data:
+                    return False
+                # Conservar el final por si el mensaje llega partido
+                pending = (pending + data)[-4096:]
+                if TUNNEL_READY_PATTERN.search(pending):
+                    return True
+        
+        return False
+
+    def drain_pipe(self, stream):
+        """Descarta la salida de un pipe hasta que se cierre"""
+        try:
+            while stream.read1(65536):
+                pass
+        except (OSError, ValueError):
+            pass
+
     def start_cloudflared_tunnel(self, cloudflared_path=None):
         """Inicia el túnel de Cloudflared"""
         token = self.get_cloudflare_token()
         if not token:
-            logging.error("""
-            ❌ ERROR: Token de Cloudflare no configurado
-            === INSTRUCCIONES PARA GITHUB CODESPACES ===
-            1. Ve a: https://github.com/<tu-usuario>/<tu-repo>/settings/secrets/codespaces
-            2. Crea un secret llamado CLOUDFLARED_TOKEN
-            3. Pega tu token de Cloudflare Zero Trust
-            4. Reinicia este Codespace
-            """)
+            self.report_missing_token()
             return False
         
         # Mostrar solo parte del token para seguridad
@@ -338,19 +774,26 @@ class SpaceBedrockManager:
             ])
             
             logging.info("🌐 Iniciando túnel Cloudflare...")
+            # cloudflared registra en stderr; stdout nunca se lee
             self.tunnel_process = subprocess.Popen(
                 cmd,
-                stdout=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
                 stderr=subprocess.PIPE,
-                text=True
+                preexec_fn=self.child_preexec
             )
             
-            time.sleep(5)  # Esperar inicialización
+            ready = self.wait_tunnel_ready(self.tunnel_process)
             
             if self.tunnel_process.poll() is not None:
                 logging.error("❌ El túnel Cloudflare falló al iniciar")
                 return False
             
+            if not ready:
+                logging.warning("⚠️ El túnel aún no confirmó la conexión, continuando...")
+            
+            # Vaciar stderr para que cloudflared no se bloquee con el pipe lleno
+            threading.Thread(target=self.drain_pipe, args=(self.tunnel_process.stderr,), daemon=True).start()
+            
             logging.info("✅ Túnel Cloudflare iniciado")
             self.connection_info = {
                 "type": "cloudflare",
@@ -364,23 +807,60 @@ class SpaceBedrockManager:
             logging.error(f"❌ Error iniciando túnel: {e}")
             return False
 
+    def is_debian(self):
+        """Detecta sistemas Debian/Ubuntu con APT"""
+        return sys.platform.startswith("linux") and any(os.path.exists(p) for p in ["/etc/debian_version", "/etc/apt/sources.list"])
+
+    def prefetch_cloudflared(self):
+        """Descarga Cloudflared en segundo plano si el túnel lo va a necesitar"""
+        cloudflared_path = self.cloudflared_path
+        if (self.is_codespaces or self.cloudflared_download is not None
+                or shutil.which("cloudflared") or self.is_debian()
+                or cloudflared_path.exists() or not self.get_cloudflare_token()):
+            return
+        
+        # Hilo daemon en lugar de un executor: al salir del menú no se espera a la descarga
+        # (un corte solo deja el .part, que la siguiente descarga sobrescribe)
+        download = Future()
+        
+        def run():
+            download.set_result(self.download_cloudflared(cloudflared_path))
+        
+        threading.Thread(target=run, daemon=True).start()
+        self.cloudflared_download = download
+
     def setup_cloudflared(self):
         """Configura Cloudflared para túnel externo (versión mejorada)"""
+        # Reutilizar el túnel si sigue activo (p. ej. iniciado desde la opción 3)
+        if self.tunnel_process and self.tunnel_process.poll() is None:
+            logging.info("✅ Túnel Cloudflare ya activo")
+            return True
+        
+        # Sin token no tiene sentido instalar ni descargar nada
+        if not self.get_cloudflare_token():
+            self.report_missing_token()
+            return False
+        
         # Verificar si ya está instalado en el sistema
         if shutil.which("cloudflared"):
             logging.info("✅ Cloudflared ya está instalado en el sistema")
             return self.start_cloudflared_tunnel()
         
         # Intentar instalación via APT en sistemas Debian
-        if platform.system() == "Linux" and any(os.path.exists(p) for p in ["/etc/debian_version", "/etc/apt/sources.list"]):
+        if self.is_debian():
             logging.info("🐧 Detectado sistema Debian/Ubuntu, usando instalación APT...")
             if self.install_cloudflared_apt():
                 return self.start_cloudflared_tunnel()
         
         # Fallback a instalación manual
-        cloudflared_path = Path(CONFIG["data_dir"]) / "cloudflared"
+        cloudflared_path = self.cloudflared_path
         
-        if not cloudflared_path.exists():
+        if self.cloudflared_download is not None:
+            # Esperar la descarga iniciada en segundo plano
+            download, self.cloudflared_download = self.cloudflared_download, None
+            if not download.result():
+                return False
+        elif not cloudflared_path.exists():
             if not self.download_cloudflared(cloudflared_path):
                 return False
         
@@ -388,78 +868,73 @@ class SpaceBedrockManager:
 
     def configure_server(self):
         """Configura server.properties optimizado y crea estructura de mundo"""
-        data_dir = Path(CONFIG["data_dir"])
-        config_path = data_dir / "server.properties"
-        world_dir = data_dir / "worlds" / CONFIG["world_name"]
+        config_path = self.config_path
+        world_dir = self.worlds_path / CONFIG["world_name"]
         
         # Crear estructura de directorios para el mundo
         world_dir.mkdir(parents=True, exist_ok=True)
         
         # Configuración optimizada del servidor
-        server_config = {
-            "server-name": "Space Bedrock Server",
-            "gamemode": "survival",
-            "difficulty": "normal",
-            "allow-cheats": "false",
-            "max-players": "10",
-            "online-mode": "true",
-            "server-port": str(CONFIG["port"]),
-            "level-name": CONFIG["world_name"],  # Usar el nombre configurado
-            "level-seed": "",  # Semilla aleatoria
-            "default-player-permission-level": "member",
-            "player-idle-timeout": "30",
-            "view-distance": "12",
-            "max-threads": "0",
-            "server-authoritative-movement": "server-auth",
-            "compression-threshold": "1",
-            "content-log-file-enabled": "true",  # Nuevo: Habilitar logs
-            "debug-output": "true"  # Nuevo: Más información en logs
-        }
+        server_config = dict(SERVER_PROPERTIES)
         
         logging.info("⚙️ Configurando servidor y mundo...")
         
         # Si existe configuración previa, conservar valores personalizados
+        current = None
         if config_path.exists():
             logging.info("🔄 Actualizando configuración existente...")
-            existing_config = {}
-            with open(config_path, 'r') as f:
-                for line in f:
-                    if '=' in line and not line.strip().startswith('#'):
-                        key, value = line.strip().split('=', 1)
-                        existing_config[key] = value
+            current = config_path.read_text()
+            lines = (line.strip() for line in current.splitlines())
+            existing_config = dict(
+                line.split('=', 1) for line in lines
+                if '=' in line and not line.startswith('#')
+            )
             
             # Conservar configuraciones existentes
-            for key in list(server_config.keys()):
-                if key in existing_config:
-                    server_config[key] = existing_config[key]
+            server_config.update({key: existing_config[key] for key in server_config.keys() & existing_config.keys()})
         
         # Escribir nueva configuración
-        with open(config_path, 'w') as f:
-            for key, value in server_config.items():
-                f.write(f"{key}={value}\n")
+        content = "".join(f"{key}={value}\n" for key, value in server_config.items())
+        # Sin cambios no se reescribe: evita ensuciar la capa del sistema de archivos
+        if content != current:
+            # Escribir a un temporal y reemplazar: un corte no deja el archivo a medias
+            tmp_path = config_path.with_name(config_path.name + ".tmp")
+            tmp_path.write_text(content)
+            os.replace(tmp_path, config_path)
                 
         # Crear archivos esenciales del mundo si no existen
         essential_files = [
             "level.dat", "levelname.txt", "world_icon.jpeg"
         ]
         
+        # O_EXCL crea el archivo solo si no existe, sin un exists() previo
         for file in essential_files:
-            file_path = world_dir / file
-            if not file_path.exists():
-                try:
-                    file_path.touch()
-                    logging.info(f"📄 Creando archivo de mundo: {file}")
-                except Exception as e:
-                    logging.error(f"❌ Error creando {file}: {e}")
+            try:
+                os.close(os.open(world_dir / file, os.O_CREAT | os.O_WRONLY | os.O_EXCL, 0o644))
+                logging.info(f"📄 Creando archivo de mundo: {file}")
+            except FileExistsError:
+                pass
+            except OSError as e:
+                logging.error(f"❌ Error creando {file}: {e}")
+
+    def iter_files(self, root, prefix=""):
+        """Recorre un árbol con os.scandir devolviendo (ruta, nombre relativo)"""
+        with os.scandir(root) as entries:
+            for entry in entries:
+                arcname = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self.iter_files(entry.path, arcname + "/")
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry.path, arcname
 
     def generate_world_backup(self):
         """Crea un backup del mundo si existe"""
-        world_dir = Path(CONFIG["data_dir"]) / "worlds"
+        world_dir = self.worlds_path
         if not world_dir.exists() or not any(world_dir.iterdir()):
             logging.info("⚠️ No hay mundos para respaldar")
             return
             
-        backup_dir = Path(CONFIG["data_dir"]) / "backups"
+        backup_dir = self.data_path / "backups"
         backup_dir.mkdir(exist_ok=True)
         
         timestamp = time.strftime("%Y%m%d-%H%M%S")
@@ -468,12 +943,23 @@ class SpaceBedrockManager:
         
         try:
             logging.info(f"💾 Creando backup: {backup_name}")
-            with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                for root, _, files in os.walk(world_dir):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, world_dir)
-                        zipf.write(file_path, arcname)
+            # Los datos del mundo (LevelDB) ya van comprimidos: por defecto solo se almacenan
+            level = CONFIG["backup_compresslevel"]
+            compression = zipfile.ZIP_STORED if level is None else zipfile.ZIP_DEFLATED
+            buf = bytearray(CONFIG["chunk_size"])
+            with zipfile.ZipFile(backup_path, 'w', compression, compresslevel=level) as zipf:
+                for file_path, arcname in self.iter_files(world_dir):
+                    # ZipFile.write copia en bloques de 8 KiB; aquí se usa el buffer de 1 MiB
+                    info = zipfile.ZipInfo.from_file(file_path, arcname)
+                    info.compress_type = compression
+                    # zipf.open(info, 'w') no aplica el compresslevel del ZipFile: va en el ZipInfo.
+                    # Python 3.13+ lo expone como compress_level; antes solo existe el atributo privado
+                    if hasattr(info, "compress_level"):
+                        info.compress_level = level
+                    else:
+                        info._compresslevel = level
+                    with open(file_path, 'rb') as src, zipf.open(info, 'w') as dst:
+                        self.stream_copy(src, dst, buf)
             
             backup_size = backup_path.stat().st_size / (1024*1024)
             logging.info(f"✅ Backup creado: {backup_name} ({backup_size:.1f}MB)")
@@ -483,25 +969,31 @@ class SpaceBedrockManager:
 
     def install_dependencies(self):
         """Instala dependencias necesarias para Bedrock Server"""
-        if platform.system() != "Linux":
+        if not sys.platform.startswith("linux") or self.dependencies_ok:
             return True
             
         logging.info("🔍 Verificando dependencias del sistema...")
         required = ["libcurl4", "openssl", "ca-certificates"]
         
         try:
-            # Verificar si ya están instalados
-            check_cmd = ["dpkg", "-s"] + required
-            result = subprocess.run(check_cmd, capture_output=True, text=True)
+            # Verificar si ya están instalados: una sola consulta con el estado de cada paquete
+            check_cmd = ["dpkg-query", "-W", "-f", "${Package} ${Status}\n"] + required
+            result = subprocess.run(check_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                    text=True, errors="replace", preexec_fn=self.child_preexec)
+            installed = {line.split(" ", 1)[0] for line in result.stdout.splitlines()
+                         if line.endswith(" install ok installed")}
+            missing = [pkg for pkg in required if pkg not in installed]
             
-            if result.returncode == 0:
+            if not missing:
                 logging.info("✅ Dependencias ya instaladas")
+                self.dependencies_ok = True
                 return True
                 
-            logging.info("⬇️ Instalando dependencias necesarias...")
-            install_cmd = ["sudo", "apt-get", "install", "-y"] + required
-            subprocess.run(install_cmd, check=True)
+            logging.info(f"⬇️ Instalando dependencias necesarias: {', '.join(missing)}")
+            install_cmd = ["sudo", "apt-get", "install", "-y"] + missing
+            subprocess.run(install_cmd, check=True, preexec_fn=self.child_preexec)
             logging.info("✅ Dependencias instaladas correctamente")
+            self.dependencies_ok = True
             return True
         except Exception as e:
             logging.error(f"❌ Error instalando dependencias: {e}")
@@ -509,21 +1001,21 @@ class SpaceBedrockManager:
             return False
 
     def is_port_in_use(self, port):
-        """Comprueba si un puerto está en uso"""
+        """Comprueba si un puerto UDP está en uso"""
+        # Bedrock escucha por UDP: un bind directo lo detecta sin lanzar lsof/netstat.
+        # Sin SO_REUSEADDR, para que un socket ya enlazado haga fallar el bind
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
-            if platform.system() == "Windows":
-                cmd = f"netstat -an | findstr :{port}"
-            else:
-                cmd = f"lsof -i:{port} -P -n | grep LISTEN"
-                
-            result = subprocess.run(cmd, shell=True, capture_output=True)
-            return result.returncode == 0
-        except Exception:
+            sock.bind(("0.0.0.0", port))
             return False
+        except OSError:
+            return True
+        finally:
+            sock.close()
 
     def start_server(self):
         """Inicia el servidor Bedrock con comprobación de puerto"""
-        server_path = Path(CONFIG["data_dir"]) / "bedrock_server"
+        server_path = self.server_path
         
         if not server_path.exists():
             logging.error("❌ Servidor no encontrado")
@@ -535,34 +1027,26 @@ class SpaceBedrockManager:
             logging.info("💡 Intenta cambiar el puerto en la configuración")
             return False
             
-        os.chdir(CONFIG["data_dir"])
         logging.info("🚀 Iniciando servidor Space Bedrock...")
         
         try:
             self.running = True
-            self.server_process = subprocess.Popen(
-                ["./bedrock_server"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True
+            # El servidor hereda stdout/stderr: sus líneas ya incluyen marca de tiempo
+            # cwd= en lugar de os.chdir: el directorio del launcher no cambia
+            data_dir = str(self.data_path)
+            process = subprocess.Popen(
+                [str(server_path)],
+                cwd=data_dir,
+                env={**os.environ, "LD_LIBRARY_PATH": data_dir},
+                preexec_fn=self.child_preexec
             )
-            
-            def log_reader():
-                while self.running and self.server_process.poll() is None:
-                    if self.server_process.stdout:
-                        line = self.server_process.stdout.readline()
-                        if line:
-                            timestamp = time.strftime("%H:%M:%S")
-                            print(f"[{timestamp}] {line.rstrip()}")
-                    else:
-                        time.sleep(0.1)
-            
-            log_thread = threading.Thread(target=log_reader, daemon=True)
-            log_thread.start()
-            
-            self.server_process.wait()
+            # Bajo el lock de cleanup: si la señal llegó durante Popen, cleanup no vio el proceso
+            with self.cleanup_lock:
+                self.server_process = process
+                if self.shutdown_event.is_set():
+                    process.terminate()
+
+            process.wait()
             return True
             
         except KeyboardInterrupt:
@@ -577,109 +1061,110 @@ class SpaceBedrockManager:
 
     def cleanup(self):
         """Limpia procesos al cerrar"""
-        self.running = False
+        # Tomar los procesos bajo lock para que una segunda llamada no los vea
+        with self.cleanup_lock:
+            self.running = False
+            server_process, self.server_process = self.server_process, None
+            tunnel_process, self.tunnel_process = self.tunnel_process, None
         
-        if self.server_process and self.server_process.poll() is None:
+        if server_process and server_process.poll() is None:
             logging.info("🛑 Deteniendo servidor...")
-            self.server_process.terminate()
+            server_process.terminate()
             try:
-                self.server_process.wait(timeout=15)
+                server_process.wait(timeout=15)
             except subprocess.TimeoutExpired:
                 logging.warning("⚠️ Forzando cierre del servidor...")
-                self.server_process.kill()
+                server_process.kill()
         
-        if self.tunnel_process and self.tunnel_process.poll() is None:
+        if tunnel_process and tunnel_process.poll() is None:
             logging.info("🔌 Deteniendo túnel...")
-            self.tunnel_process.terminate()
+            tunnel_process.terminate()
             try:
-                self.tunnel_process.wait(timeout=5)
+                tunnel_process.wait(timeout=5)
             except subprocess.TimeoutExpired:
-                self.tunnel_process.kill()
+                tunnel_process.kill()
 
     def list_zip_files(self):
         """Lista archivos ZIP disponibles"""
-        data_path = Path(CONFIG["data_dir"])
+        data_path = self.data_path
         current_path = Path(".")
         
         zip_files = []
         for search_path in [current_path, data_path]:
-            for zip_file in search_path.glob("*.zip"):
-                zip_files.append(zip_file)
+            zip_files.extend(self.scan_zip_files(search_path))
         
         if zip_files:
             print("\n📦 Archivos ZIP encontrados:")
-            for i, zip_file in enumerate(zip_files, 1):
-                size_mb = zip_file.stat().st_size / (1024*1024)
-                print(f"   {i}. {zip_file.name} ({size_mb:.1f}MB)")
+            for i, entry in enumerate(zip_files, 1):
+                size_mb = entry.stat().st_size / (1024*1024)
+                print(f"   {i}. {entry.name} ({size_mb:.1f}MB)")
         else:
             print("\n❌ No se encontraron archivos ZIP")
             print("💡 Sube un archivo ZIP del servidor Bedrock a este directorio")
 
+    @functools.cached_property
+    def menu_text(self):
+        """Texto del menú; sus valores no cambian durante la ejecución"""
+        return MENU_TEMPLATE.format(
+            separator='=' * 55,
+            environment='Codespaces' if self.is_codespaces else 'Local/VPS',
+            data_dir=CONFIG['data_dir'],
+            port=CONFIG['port'],
+            world_name=CONFIG['world_name']
+        )
+
     def show_menu(self):
         """Muestra el menú interactivo"""
-        os.system('cls' if os.name == 'nt' else 'clear')
-        print(f"""
-        ███████╗██████╗  █████╗  ██████╗███████╗
-        ██╔════╝██╔══██╗██╔══██╗██╔════╝██╔════╝
-        ███████╗██████╔╝███████║██║     █████╗  
-        ╚════██║██╔═══╝ ██╔══██║██║     ██╔══╝  
-        ███████║██║     ██║  ██║╚██████╗███████╗
-        ╚══════╝╚═╝     ╚═╝  ╚═╝ ╚═════╝╚══════╝
-        
-        Space Bedrock Server Launcher v2.1 (Manual ZIP)
-        {'='*55}
-        Versión: Manual ZIP
-        Entorno: {'Codespaces' if self.is_codespaces else 'Local/VPS'}
-        Directorio: {CONFIG['data_dir']}
-        Puerto: {CONFIG['port']}
-        Mundo: {CONFIG['world_name']}
-        {'='*55}
-        1. Iniciar servidor
-        2. Ver archivos ZIP disponibles
-        3. Configurar túnel
-        4. Editar configuración
-        5. Crear backup del mundo
-        6. Reinstalar servidor (eliminar instalación actual)
-        7. Salir
-        {'='*55}
-        """)
+        clear_screen()
+        print(self.menu_text)
         return input("Seleccione una opción: ").strip()
 
     def reinstall_server(self):
         """Elimina la instalación actual para forzar reinstalación"""
-        server_path = Path(CONFIG["data_dir"]) / "bedrock_server"
-        if server_path.exists():
-            try:
-                server_path.unlink()
-                logging.info("🗑️ Servidor eliminado. Se reinstalará en el próximo inicio.")
-                
-                # También eliminar archivos relacionados si existen
-                files_to_remove = [
-                    "server.properties",
-                    "allowlist.json", 
-                    "permissions.json"
-                ]
-                
-                for file_name in files_to_remove:
-                    file_path = Path(CONFIG["data_dir"]) / file_name
-                    if file_path.exists():
-                        response = input(f"¿Eliminar {file_name}? (y/N): ").lower()
-                        if response == 'y':
-                            file_path.unlink()
-                            logging.info(f"🗑️ {file_name} eliminado")
-                
-            except Exception as e:
-                logging.error(f"❌ Error eliminando servidor: {e}")
-        else:
+        try:
+            self.server_path.unlink()
+        except FileNotFoundError:
             logging.info("⚠️ No hay servidor instalado")
+            return
+        except OSError as e:
+            logging.error(f"❌ Error eliminando servidor: {e}")
+            return
+        logging.info("🗑️ Servidor eliminado. Se reinstalará en el próximo inicio.")
+        
+        # También eliminar archivos relacionados si existen (una sola pregunta)
+        files_to_remove = [
+            name for name in ("server.properties", "allowlist.json", "permissions.json")
+            if (self.data_path / name).is_file()
+        ]
+        if not files_to_remove:
+            return
+        
+        for i, file_name in enumerate(files_to_remove, 1):
+            print(f"  {i}. {file_name}")
+        response = input("¿Eliminar archivos? (números separados por comas / all / N): ").strip().lower()
+        
+        if response == "all":
+            chosen = files_to_remove
+        else:
+            indices = {int(n) for n in response.split(",") if n.strip().isdigit()}
+            chosen = [name for i, name in enumerate(files_to_remove, 1) if i in indices]
+        
+        for file_name in chosen:
+            try:
+                (self.data_path / file_name).unlink()
+                logging.info(f"🗑️ {file_name} eliminado")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.error(f"❌ Error eliminando {file_name}: {e}")
 
     def edit_configuration(self):
         """Edita la configuración del servidor"""
-        config_path = Path(CONFIG["data_dir"]) / "server.properties"
+        config_path = self.config_path
         if config_path.exists():
             editor = "nano" if sys.platform != "win32" else "notepad"
             try:
-                subprocess.run([editor, str(config_path)])
+                subprocess.run([editor, str(config_path)], preexec_fn=self.child_preexec)
                 print("✅ Configuración guardada")
             except FileNotFoundError:
                 print("⚠️ Editor no encontrado. Mostrando contenido del archivo:")
@@ -698,6 +1183,9 @@ class SpaceBedrockManager:
             choice = self.show_menu()
             
             if choice == "1":
+                # Solapar la descarga de Cloudflared con la instalación
+                self.prefetch_cloudflared()
+                
                 if not self.install_bedrock_server():
                     input("\nError instalando servidor. Presione Enter...")
                     continue
@@ -734,6 +1222,9 @@ class SpaceBedrockManager:
                 self.start_server()
                 self.cleanup()
                 
+                if self.shutdown_event.is_set():
+                    sys.exit(0)
+                
             elif choice == "2":
                 self.list_zip_files()
                 input("\nPresione Enter para continuar...")